@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Red Degradada - Reconexión y redelivery QoS 1 bajo pérdidas
+Ejecuta SecureIoTClient contra el broker local a través del proxy de
+degradación y reporta goodput, duplicados, tiempo de reconexión y pérdida
+de mensajes por escenario y modo de cliente.
+
+Autor: Universidad Militar Nueva Granada - Mecatrónica
+Proyecto: Comunicaciones IoT Seguras
+Fecha: Noviembre 2025
+
+Modos de cliente:
+    plain         SecureIoTClient sin control de tasa
+    adaptive      SecureIoTClient con AdaptiveRateController (techo = --rate)
+    sdk           DeviceSimulator (SDK de Azure) sin control de tasa
+    sdk_adaptive  DeviceSimulator con AdaptiveRateController (techo = --rate)
+
+Columnas:
+    ofrec     Intentos de envío realizados
+    difer     Turnos omitidos por ir atrasado (no se recuperan en ráfaga)
+    acept     Mensajes aceptados por el cliente
+    descon    Rechazados por estar desconectado
+    tasa      Rechazados por el control de tasa (sin cupo en 10 s)
+
+El SDK de Azure siempre conecta al puerto 8883, así que en los modos sdk el
+proxy escucha en 127.0.0.1:8883: el puerto debe estar libre y esos modos no
+pueden ejecutarse en paralelo con otra instancia del benchmark.
+
+Uso:
+    python benchmarks/bench_impairment.py
+    python benchmarks/bench_impairment.py --scenario flaky_wifi --rate 50 --duration 30 --json out.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib.util
+import tempfile
+import statistics
+import contextlib
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from benchmarks.local_broker import LocalBroker, generate_test_pki
+from benchmarks.impairment_proxy import ImpairmentProxy, Impairment
+
+# Perfiles de red (valores por sentido)
+SCENARIOS = {
+    'baseline': Impairment(),
+    'hospital_wifi': Impairment(latency=0.030, jitter=0.020),
+    'lossy': Impairment(latency=0.020, jitter=0.010, stall_probability=0.02, stall_duration=0.3),
+    'narrowband': Impairment(latency=0.050, bandwidth=4_000),
+    'flaky_wifi': Impairment(latency=0.030, jitter=0.020, stall_probability=0.01,
+                             stall_duration=0.5, reset_interval=6.0),
+}
+
+MODES = ('plain', 'adaptive', 'sdk', 'sdk_adaptive')
+SDK_PORT = 8883
+
+
+def run_scenario(pki: dict, name: str, mode: str, rate: float, duration: float,
+                 drain_timeout: float, seed: int) -> dict:
+    """
+    Ejecutar un escenario con un modo de cliente
+
+    Returns:
+        Diccionario con las métricas del escenario
+    """
+    from rate_control import AdaptiveRateController
+
+    device_id = 'thing_bench'
+    device_dir = pki['devices'][device_id]
+    sdk = mode.startswith('sdk')
+
+    with LocalBroker(certfile=str(pki['server_cert']), keyfile=str(pki['server_key']),
+                     ca_certs=str(pki['ca'])) as broker, \
+            ImpairmentProxy('127.0.0.1', broker.port, SCENARIOS[name], seed=seed,
+                            port=SDK_PORT if sdk else 0) as proxy:
+
+        controller = AdaptiveRateController(rate) if mode.endswith('adaptive') else None
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if sdk:
+                from device_simulator import DeviceSimulator
+                client = DeviceSimulator(
+                    device_id=device_id,
+                    cert_path=str(device_dir / 'device-cert.pem'),
+                    key_path=str(device_dir / 'device-key.pem'),
+                    rate_controller=controller,
+                    hostname='localhost',
+                    ca_path=str(pki['ca'])
+                )
+                send = lambda: client.send_message(client.generate_telemetry())
+            else:
+                from mqtt_secure_client import SecureIoTClient
+                client = SecureIoTClient(
+                    device_id=device_id,
+                    cert_path=str(device_dir / 'device-cert.pem'),
+                    key_path=str(device_dir / 'device-key.pem'),
+                    hostname='localhost',
+                    port=proxy.port,
+                    ca_path=str(pki['ca']),
+                    rate_controller=controller
+                )
+                send = lambda: client.send_telemetry(client.generate_vital_signs())
+
+            if not client.connect():
+                return {'scenario': name, 'mode': mode, 'error': 'connect failed'}
+
+            start = time.monotonic()
+            next_send = start
+            offered = 0
+            deferred = 0.0
+            while time.monotonic() - start < duration:
+                send()
+                offered += 1
+                next_send += 1.0 / rate
+                now = time.monotonic()
+                if next_send < now:
+                    # Atrasado (p. ej. acquire() bloqueó): los turnos perdidos se
+                    # omiten en lugar de enviarse en ráfaga al recuperar el ritmo
+                    deferred += (now - next_send) * rate
+                    next_send = now
+                else:
+                    time.sleep(next_send - now)
+            send_end = time.monotonic()
+
+            # Esperar a que lleguen los mensajes aceptados (redelivery incluida)
+            accepted = client.message_count
+            deadline = time.monotonic() + drain_timeout
+            while time.monotonic() < deadline:
+                if len(_received_ids(broker)) >= accepted:
+                    break
+                time.sleep(0.05)
+
+            client.disconnect()
+            if sdk:
+                # Detener los hilos del SDK antes de cerrar el broker
+                client.client.shutdown()
+
+        received = [r for r in broker.publishes if '/messages/events/' in r.topic]
+        ids = _received_ids(broker)
+        lost = sum(1 for message_id in range(accepted) if message_id not in ids)
+        last_receive = max((r.received_at for r in received), default=send_end)
+        elapsed = max(last_receive - start, 1e-9)
+
+        # Reconexión: desde cada reset del proxy hasta el siguiente CONNECT en el broker
+        reconnects = []
+        for reset_at in proxy.reset_times:
+            later = [t for t in broker.connect_times if t > reset_at]
+            if later:
+                reconnects.append(min(later) - reset_at)
+
+        return {
+            'scenario': name,
+            'mode': mode,
+            'offered': offered,
+            'deferred': round(deferred),
+            'accepted': accepted,
+            'offline': client.stats['messages_offline'],
+            'rate_limited': client.stats['messages_rate_limited'],
+            'failed': client.stats['messages_failed'],
+            'received_unique': len(ids),
+            'duplicates': len(received) - len(ids),
+            'dup_flag': sum(1 for r in received if r.dup),
+            'lost': lost,
+            'goodput_msg_s': len(ids) / elapsed,
+            'goodput_kb_s': sum(len(r.payload) for r in received) / elapsed / 1024,
+            'resets': proxy.stats['resets'],
+            'stalls': proxy.stats['stalls'],
+            'reconnect_mean_s': statistics.mean(reconnects) if reconnects else None,
+            'reconnect_max_s': max(reconnects) if reconnects else None,
+            'unrecovered_resets': len(proxy.reset_times) - len(reconnects),
+        }
+
+
+def _received_ids(broker: LocalBroker) -> set:
+    """messageId únicos recibidos en el topic de telemetría D2C"""
+    ids = set()
+    for record in list(broker.publishes):
+        if '/messages/events/' in record.topic:
+            ids.add(json.loads(record.payload)['messageId'])
+    return ids
+
+
+def _sdk_available() -> bool:
+    """True si el SDK de Azure IoT está instalado (modos sdk)"""
+    try:
+        return importlib.util.find_spec('azure.iot.device') is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def _fmt(value, spec: str) -> str:
+    return '-' if value is None else format(value, spec)
+
+
+def main():
+    """Punto de entrada principal"""
+    parser = argparse.ArgumentParser(description="Benchmark de los clientes IoT bajo red degradada")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="Escenario a ejecutar (repetible, default: todos)")
+    parser.add_argument('--mode', action='append', choices=MODES,
+                        help="Modo de cliente (repetible, default: todos)")
+    parser.add_argument('--rate', type=float, default=20.0, help="Mensajes/s ofrecidos")
+    parser.add_argument('--duration', type=float, default=20.0, help="Segundos de envío")
+    parser.add_argument('--drain-timeout', type=float, default=15.0,
+                        help="Segundos máximos esperando redelivery al final")
+    parser.add_argument('--seed', type=int, default=2025, help="Semilla de la degradación")
+    parser.add_argument('--json', help="Guardar resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    modes = args.mode or list(MODES)
+    results = []
+
+    if not _sdk_available() and any(mode.startswith('sdk') for mode in modes):
+        print("⚠️  azure-iot-device no está instalado: se omiten los modos sdk")
+        modes = [mode for mode in modes if not mode.startswith('sdk')]
+
+    # DeviceSimulator lee estas variables si no recibe los objetos: vacías
+    # (no eliminadas) para que load_dotenv no las rellene desde .env
+    os.environ.update(CERT_BUNDLE='', IOTHUB_TIER='', PROFILE_STAGES='')
+    # Los resets del proxy son esperados: sin advertencia del SDK por cada uno
+    logging.getLogger('azure.iot.device').setLevel(logging.ERROR)
+
+    print(f"{'escenario':<14} {'modo':<13} {'ofrec':>6} {'difer':>6} {'acept':>6} {'descon':>6} "
+          f"{'tasa':>5} {'únicos':>7} {'dup':>4} {'perd':>5} {'msg/s':>7} {'resets':>6} {'reconx(s)':>10}")
+    print("─" * 107)
+
+    with tempfile.TemporaryDirectory(prefix='iot-bench-') as tmp:
+        pki = generate_test_pki(tmp, ['thing_bench'])
+        for name in scenarios:
+            for mode in modes:
+                result = run_scenario(pki, name, mode, args.rate, args.duration,
+                                      args.drain_timeout, args.seed)
+                results.append(result)
+                if 'error' in result:
+                    print(f"{name:<14} {mode:<13} ❌ {result['error']}")
+                    continue
+                print(f"{name:<14} {mode:<13} {result['offered']:>6} {result['deferred']:>6} "
+                      f"{result['accepted']:>6} {result['offline']:>6} {result['rate_limited']:>5} "
+                      f"{result['received_unique']:>7} {result['duplicates']:>4} {result['lost']:>5} "
+                      f"{result['goodput_msg_s']:>7.2f} {result['resets']:>6} "
+                      f"{_fmt(result['reconnect_mean_s'], '>10.2f')}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
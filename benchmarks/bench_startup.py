@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Arranque - Costo de importación y tiempo hasta el primer publish
+Mide `python -X importtime` de ambos puntos de entrada y el tiempo de pared
+desde que se lanza mqtt_secure_client.py hasta que el broker local recibe el
+primer mensaje. Sale con código 1 si se supera algún umbral (regresión).
+
+Autor: Universidad Militar Nueva Granada - Mecatrónica
+Proyecto: Comunicaciones IoT Seguras
+Fecha: Noviembre 2025
+
+Uso:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --max-import-ms 50 --max-first-publish-ms 1000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from benchmarks.local_broker import LocalBroker, generate_test_pki
+
+ENTRY_POINTS = ('mqtt_secure_client', 'device_simulator')
+
+
+def measure_import_ms(module: str) -> float:
+    """
+    Costo acumulado de importar un módulo en un intérprete nuevo
+
+    Returns:
+        Milisegundos reportados por -X importtime para el módulo
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True)
+
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000.0
+    raise RuntimeError(f"importtime no reportó {module}")
+
+
+def measure_first_publish_ms(pki: dict, device_id: str, timeout: float = 15.0) -> float:
+    """
+    Tiempo de pared desde el lanzamiento del proceso hasta el primer PUBLISH
+
+    Returns:
+        Milisegundos hasta que el broker local recibe el primer mensaje
+    """
+    with LocalBroker(certfile=str(pki['server_cert']), keyfile=str(pki['server_key']),
+                     ca_certs=str(pki['ca'])) as broker:
+        device_dir = pki['devices'][device_id]
+        env = dict(os.environ,
+                   DEVICE_ID=device_id,
+                   IOTHUB_HOSTNAME='localhost',
+                   MQTT_PORT=str(broker.port),
+                   CERT_PATH=str(device_dir / 'device-cert.pem'),
+                   KEY_PATH=str(device_dir / 'device-key.pem'),
+                   CA_PATH=str(pki['ca']),
+                   TELEMETRY_INTERVAL='1',
+                   # Vacías (no eliminadas): load_dotenv rellenaría las ausentes desde .env
+                   CERT_BUNDLE='',
+                   IOTHUB_TIER='',
+                   PROFILE_STAGES='')
+
+        start = time.monotonic()
+        process = subprocess.Popen([sys.executable, 'mqtt_secure_client.py'], cwd=BASE_DIR,
+                                   env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not broker.wait_for_publishes(1, timeout):
+                raise RuntimeError(f"Sin publish en {timeout}s")
+            return (broker.publishes[0].received_at - start) * 1000.0
+        finally:
+            process.kill()
+            process.wait()
+
+
+def main():
+    """Punto de entrada principal"""
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de los clientes IoT")
+    parser.add_argument('--runs', type=int, default=5, help="Repeticiones por medición")
+    parser.add_argument('--max-import-ms', type=float, default=50.0,
+                        help="Umbral de importación por punto de entrada (mejor corrida)")
+    parser.add_argument('--max-first-publish-ms', type=float, default=1000.0,
+                        help="Umbral de tiempo hasta el primer publish (mediana)")
+    parser.add_argument('--skip-publish', action='store_true',
+                        help="Solo medir importación (sin broker local)")
+    args = parser.parse_args()
+
+    failures = []
+
+    print("⏱️  Importación (-X importtime, mejor de {} corridas)".format(args.runs))
+    for module in ENTRY_POINTS:
+        samples = [measure_import_ms(module) for _ in range(args.runs)]
+        best = min(samples)
+        status = '✅' if best <= args.max_import_ms else '❌'
+        print(f"   {status} {module:<20} {best:8.1f} ms  (mediana {statistics.median(samples):.1f} ms)")
+        if best > args.max_import_ms:
+            failures.append(f"{module}: importación {best:.1f} ms > {args.max_import_ms} ms")
+
+    if not args.skip_publish:
+        print(f"🚀 Tiempo hasta el primer publish (mediana de {args.runs} corridas)")
+        with tempfile.TemporaryDirectory(prefix='iot-bench-') as tmp:
+            pki = generate_test_pki(tmp, ['thing_bench'])
+            samples = [measure_first_publish_ms(pki, 'thing_bench') for _ in range(args.runs)]
+        median = statistics.median(samples)
+        status = '✅' if median <= args.max_first_publish_ms else '❌'
+        print(f"   {status} mqtt_secure_client   {median:8.1f} ms  (mín {min(samples):.1f} ms)")
+        if median > args.max_first_publish_ms:
+            failures.append(f"primer publish {median:.1f} ms > {args.max_first_publish_ms} ms")
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"❌ Regresión: {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Impairment Proxy - Proxy TCP local que degrada la red entre cliente y broker
+Inyecta latencia, jitter, límite de ancho de banda, bloqueos tipo pérdida de
+paquetes (retransmisión TCP) y resets de conexión. Es transparente a TLS.
+
+Autor: Universidad Militar Nueva Granada - Mecatrónica
+Proyecto: Comunicaciones IoT Seguras
+Fecha: Noviembre 2025
+"""
+
+import time
+import random
+import socket
+import struct
+import asyncio
+import threading
+from typing import Optional, List
+
+
+class Impairment:
+    """Perfil de degradación aplicado en cada sentido de la conexión"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 bandwidth: Optional[float] = None,
+                 stall_probability: float = 0.0, stall_duration: float = 0.2,
+                 reset_interval: Optional[float] = None):
+        """
+        Args:
+            latency: Retardo base por sentido (s)
+            jitter: Variación uniforme ± sobre la latencia (s)
+            bandwidth: Límite en bytes/s por sentido (None = sin límite)
+            stall_probability: Probabilidad por segmento de un bloqueo tipo pérdida
+            stall_duration: Duración del bloqueo (s), similar a un RTO de TCP
+            reset_interval: Media (s) entre resets de conexión (None = nunca)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.stall_probability = stall_probability
+        self.stall_duration = stall_duration
+        self.reset_interval = reset_interval
+
+    def __repr__(self):
+        return (f"Impairment(latency={self.latency}, jitter={self.jitter}, "
+                f"bandwidth={self.bandwidth}, stall_probability={self.stall_probability}, "
+                f"reset_interval={self.reset_interval})")
+
+
+def _abort(writer: asyncio.StreamWriter):
+    """Cerrar con RST (SO_LINGER 0) en lugar de FIN, como una caída real de Wi-Fi"""
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        except OSError:
+            pass
+    writer.transport.abort()
+
+
+class ImpairmentProxy:
+    """
+    Proxy TCP ejecutado en un hilo de fondo con su propio event loop
+    """
+
+    def __init__(self, target_host: str, target_port: int,
+                 impairment: Optional[Impairment] = None,
+                 host: str = '127.0.0.1', port: int = 0, seed: Optional[int] = None):
+        """
+        Args:
+            target_host: Host del broker
+            target_port: Puerto del broker
+            impairment: Perfil de degradación (None = proxy transparente)
+            host: Interfaz de escucha
+            port: Puerto de escucha (0 = asignado por el sistema)
+            seed: Semilla para que los escenarios sean reproducibles
+        """
+        self.target_host = target_host
+        self.target_port = target_port
+        self.impairment = impairment or Impairment()
+        self.host = host
+        self.port = port
+        self._random = random.Random(seed)
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._connections = set()
+
+        self.reset_times: List[float] = []
+        self.stats = {
+            'connections': 0,
+            'resets': 0,
+            'stalls': 0,
+            'bytes_forwarded': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self) -> 'ImpairmentProxy':
+        """Iniciar el proxy y esperar a que acepte conexiones"""
+        ready = threading.Event()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_client, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name='impairment-proxy', daemon=True)
+        self._thread.start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        """Detener el proxy y cerrar todas las conexiones"""
+        if self._loop is None:
+            return
+
+        async def _shutdown():
+            self._server.close()
+            for pair in list(self._connections):
+                for writer in pair:
+                    writer.transport.abort()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop.close()
+        self._loop = None
+
+    def reset_all(self):
+        """Forzar un reset de todas las conexiones activas"""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._reset_all(), self._loop).result(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # Reenvío con degradación
+    # ------------------------------------------------------------------
+
+    async def _reset_all(self):
+        for pair in list(self._connections):
+            self._reset(pair)
+
+    def _reset(self, pair):
+        if pair not in self._connections:
+            return
+        self._connections.discard(pair)
+        self.stats['resets'] += 1
+        self.reset_times.append(time.monotonic())
+        for writer in pair:
+            _abort(writer)
+
+    async def _handle_client(self, client_reader: asyncio.StreamReader,
+                             client_writer: asyncio.StreamWriter):
+        """Conectar con el broker y reenviar en ambos sentidos"""
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                self.target_host, self.target_port)
+        except OSError:
+            _abort(client_writer)
+            return
+
+        pair = (client_writer, upstream_writer)
+        self._connections.add(pair)
+        self.stats['connections'] += 1
+
+        tasks = [
+            asyncio.ensure_future(self._pipe(client_reader, upstream_writer)),
+            asyncio.ensure_future(self._pipe(upstream_reader, client_writer)),
+        ]
+        if self.impairment.reset_interval:
+            delay = self._random.expovariate(1.0 / self.impairment.reset_interval)
+            tasks.append(asyncio.ensure_future(self._reset_after(pair, delay)))
+
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+        if pair in self._connections:
+            self._connections.discard(pair)
+            for writer in pair:
+                writer.close()
+
+    async def _reset_after(self, pair, delay: float):
+        await asyncio.sleep(delay)
+        self._reset(pair)
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Reenviar un sentido. Cada segmento se entrega en
+        max(fin de transmisión + latencia ± jitter, entrega del segmento anterior)
+        """
+        imp = self.impairment
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def _deliver():
+            while True:
+                release_at, data = await queue.get()
+                if data is None:
+                    return
+                delay = release_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+                self.stats['bytes_forwarded'] += len(data)
+
+        sender = asyncio.ensure_future(_deliver())
+        link_free_at = 0.0
+        last_release = 0.0
+        try:
+            while not sender.done():
+                data = await reader.read(16384)
+                if not data:
+                    break
+                now = time.monotonic()
+                delay = imp.latency
+                if imp.jitter:
+                    delay = max(0.0, delay + self._random.uniform(-imp.jitter, imp.jitter))
+                if imp.stall_probability and self._random.random() < imp.stall_probability:
+                    # Pérdida + retransmisión: el segmento y los siguientes quedan bloqueados
+                    self.stats['stalls'] += 1
+                    delay += imp.stall_duration
+                link_free_at = max(now, link_free_at)
+                if imp.bandwidth:
+                    link_free_at += len(data) / imp.bandwidth
+                # TCP entrega en orden: nunca antes que el segmento previo
+                release_at = max(link_free_at + delay, last_release)
+                last_release = release_at
+                await queue.put((release_at, data))
+            await queue.put((0.0, None))
+            await sender
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            sender.cancel()
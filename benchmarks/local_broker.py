@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Local Broker Stand-in - Broker MQTT 3.1.1 mínimo para benchmarks locales
+Acepta conexiones TLS con autenticación X.509 mutua (igual que Azure IoT Hub)
+y registra cada PUBLISH recibido para medir tiempos y entregas
+
+Autor: Universidad Militar Nueva Granada - Mecatrónica
+Proyecto: Comunicaciones IoT Seguras
+Fecha: Noviembre 2025
+
+No es un broker completo: no reenvía mensajes entre clientes ni persiste
+sesiones. Solo implementa lo necesario para SecureIoTClient.
+"""
+
+import ssl
+import time
+import struct
+import asyncio
+import datetime
+import threading
+from pathlib import Path
+from typing import Optional, Dict, List, Callable
+
+# Tipos de paquete MQTT 3.1.1
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+class PublishRecord:
+    """PUBLISH recibido por el broker"""
+
+    __slots__ = ('client_id', 'topic', 'payload', 'qos', 'dup', 'received_at')
+
+    def __init__(self, client_id: str, topic: str, payload: bytes, qos: int, dup: bool):
+        self.client_id = client_id
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.dup = dup
+        self.received_at = time.monotonic()
+
+
+def generate_test_pki(directory, device_ids: List[str], hostname: str = 'localhost') -> Dict[str, Path]:
+    """
+    Generar CA, certificado de servidor y certificados de dispositivo de prueba
+
+    Args:
+        directory: Directorio de salida
+        device_ids: Dispositivos a generar (layout certs/devices/{id}/)
+        hostname: Nombre incluido en el SAN del servidor
+
+    Returns:
+        Diccionario con rutas 'ca', 'server_cert', 'server_key' y 'devices'
+    """
+    import ipaddress
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    now = datetime.datetime.utcnow()
+
+    def _issue(subject: str, issuer_name, issuer_key, is_ca: bool = False, san=None):
+        key = ec.generate_private_key(ec.SECP256R1())
+        builder = (x509.CertificateBuilder()
+                   .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject)]))
+                   .issuer_name(issuer_name or x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject)]))
+                   .public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(minutes=5))
+                   .not_valid_after(now + datetime.timedelta(days=1))
+                   .add_extension(x509.BasicConstraints(ca=is_ca, path_length=None), critical=True))
+        if san:
+            builder = builder.add_extension(x509.SubjectAlternativeName(san), critical=False)
+        cert = builder.sign(issuer_key or key, hashes.SHA256())
+        return key, cert
+
+    def _save(cert_path: Path, key_path: Path, key, cert):
+        cert_path.parent.mkdir(parents=True, exist_ok=True)
+        cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+        key_path.write_bytes(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()))
+
+    ca_key, ca_cert = _issue('Local Benchmark Root CA', None, None, is_ca=True)
+    _save(directory / 'root' / 'ca-cert.pem', directory / 'root' / 'ca-key.pem', ca_key, ca_cert)
+
+    server_key, server_cert = _issue(hostname, ca_cert.subject, ca_key, san=[
+        x509.DNSName(hostname), x509.IPAddress(ipaddress.ip_address('127.0.0.1'))])
+    _save(directory / 'server' / 'server-cert.pem', directory / 'server' / 'server-key.pem',
+          server_key, server_cert)
+
+    devices = {}
+    for device_id in device_ids:
+        device_key, device_cert = _issue(device_id, ca_cert.subject, ca_key)
+        device_dir = directory / 'devices' / device_id
+        _save(device_dir / 'device-cert.pem', device_dir / 'device-key.pem', device_key, device_cert)
+        devices[device_id] = device_dir
+
+    return {
+        'ca': directory / 'root' / 'ca-cert.pem',
+        'server_cert': directory / 'server' / 'server-cert.pem',
+        'server_key': directory / 'server' / 'server-key.pem',
+        'devices': devices,
+    }
+
+
+class LocalBroker:
+    """
+    Broker MQTT local ejecutado en un hilo de fondo con su propio event loop
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 certfile: Optional[str] = None, keyfile: Optional[str] = None,
+                 ca_certs: Optional[str] = None,
+                 on_publish: Optional[Callable[[PublishRecord], None]] = None):
+        """
+        Args:
+            host: Interfaz de escucha
+            port: Puerto (0 = asignado por el sistema)
+            certfile: Certificado del servidor (None = MQTT sin TLS)
+            keyfile: Clave privada del servidor
+            ca_certs: CA para exigir certificado X.509 del cliente
+            on_publish: Callback invocado (en el hilo del broker) por cada PUBLISH
+        """
+        self.host = host
+        self.port = port
+        self.on_publish = on_publish
+
+        self._ssl_context = None
+        if certfile:
+            self._ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self._ssl_context.load_cert_chain(certfile, keyfile)
+            if ca_certs:
+                self._ssl_context.load_verify_locations(ca_certs)
+                self._ssl_context.verify_mode = ssl.CERT_REQUIRED
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._writers = set()
+
+        self.publishes: List[PublishRecord] = []
+        self.connect_times: List[float] = []
+        self.stats = {
+            'connections': 0,
+            'publishes': 0,
+            'duplicates': 0,
+            'bytes_received': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self) -> 'LocalBroker':
+        """Iniciar el broker y esperar a que acepte conexiones"""
+        ready = threading.Event()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(asyncio.start_server(
+                self._handle_client, self.host, self.port, ssl=self._ssl_context))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name='local-broker', daemon=True)
+        self._thread.start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        """Detener el broker y cerrar todas las conexiones"""
+        if self._loop is None:
+            return
+
+        async def _shutdown():
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop.close()
+        self._loop = None
+
+    def drop_connections(self):
+        """Cerrar abruptamente todas las conexiones activas (simula caída del hub)"""
+        if self._loop is not None:
+            for writer in list(self._writers):
+                self._loop.call_soon_threadsafe(writer.transport.abort)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # Protocolo MQTT 3.1.1
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    async def _read_packet(reader: asyncio.StreamReader):
+        """Leer un paquete MQTT completo (encabezado fijo + cuerpo)"""
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b''
+        return header, body
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atender una conexión de cliente hasta DISCONNECT o cierre"""
+        self._writers.add(writer)
+        client_id = ''
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                packet_type = header >> 4
+                with self._lock:
+                    self.stats['bytes_received'] += len(body) + 2
+
+                if packet_type == CONNECT:
+                    name_len = struct.unpack_from('!H', body, 0)[0]
+                    id_offset = 2 + name_len + 4
+                    id_len = struct.unpack_from('!H', body, id_offset)[0]
+                    client_id = body[id_offset + 2:id_offset + 2 + id_len].decode('utf-8')
+                    with self._lock:
+                        self.stats['connections'] += 1
+                        self.connect_times.append(time.monotonic())
+                    writer.write(bytes((CONNACK << 4, 2, 0, 0)))
+
+                elif packet_type == PUBLISH:
+                    qos = (header >> 1) & 0x03
+                    dup = bool(header & 0x08)
+                    topic_len = struct.unpack_from('!H', body, 0)[0]
+                    topic = body[2:2 + topic_len].decode('utf-8')
+                    offset = 2 + topic_len
+                    packet_id = None
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                    record = PublishRecord(client_id, topic, body[offset:], qos, dup)
+                    with self._lock:
+                        self.publishes.append(record)
+                        self.stats['publishes'] += 1
+                        self.stats['duplicates'] += dup
+                    if self.on_publish:
+                        self.on_publish(record)
+                    if qos == 1:
+                        writer.write(bytes((PUBACK << 4, 2)) + packet_id)
+                    elif qos == 2:
+                        writer.write(bytes((PUBREC << 4, 2)) + packet_id)
+
+                elif packet_type == PUBREL:
+                    writer.write(bytes((PUBCOMP << 4, 2)) + body[:2])
+
+                elif packet_type == SUBSCRIBE:
+                    packet_id = body[:2]
+                    granted = bytearray()
+                    offset = 2
+                    while offset < len(body):
+                        topic_len = struct.unpack_from('!H', body, offset)[0]
+                        offset += 2 + topic_len
+                        granted.append(min(body[offset], 1))
+                        offset += 1
+                    writer.write(bytes((SUBACK << 4, 2 + len(granted))) + packet_id + bytes(granted))
+
+                elif packet_type == UNSUBSCRIBE:
+                    writer.write(bytes((UNSUBACK << 4, 2)) + body[:2])
+
+                elif packet_type == PINGREQ:
+                    writer.write(bytes((PINGRESP << 4, 0)))
+
+                elif packet_type == DISCONNECT:
+                    break
+
+                await writer.drain()
+
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def wait_for_publishes(self, count: int, timeout: float = 10.0) -> bool:
+        """Esperar hasta recibir al menos `count` PUBLISH"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if len(self.publishes) >= count:
+                    return True
+            time.sleep(0.005)
+        return False
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Almacén de Certificados Indexado - Bundle único para flotas de dispositivos
+Empaqueta los pares certificado/clave de cada dispositivo en un solo archivo
+con tabla hash, mapeado en memoria y con búsqueda O(1) por Device ID
+
+Autor: Universidad Militar Nueva Granada - Mecatrónica
+Proyecto: Comunicaciones IoT Seguras
+Fecha: Noviembre 2025
+
+Formato del bundle (little-endian):
+    Encabezado: magic (8 bytes) | número de slots (u32) | número de entradas (u32)
+    Slots:      hash (u64) | id_off | id_len | cert_off | cert_len | key_off | key_len (u32)
+    Datos:      Device IDs (UTF-8) y PEMs concatenados, referenciados por offset
+"""
+
+import os
+import mmap
+import shutil
+import struct
+import hashlib
+import weakref
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple, Union
+
+BUNDLE_MAGIC = b'IOTCERT1'
+CERT_FILENAME = 'device-cert.pem'
+KEY_FILENAME = 'device-key.pem'
+
+# Directorio en RAM para el respaldo sin memfd (Linux antiguo)
+_SHM_DIR = '/dev/shm'
+
+_HEADER = struct.Struct('<8sII')
+_SLOT = struct.Struct('<QIIIIII')
+
+
+def _hash_device_id(device_id: bytes) -> int:
+    """Hash estable de 64 bits del Device ID (independiente de PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(device_id, digest_size=8).digest(), 'little')
+
+
+def _slot_count(entries: int) -> int:
+    """Potencia de 2 con factor de carga <= 0.5 para sondeo lineal corto"""
+    slots = 1
+    while slots < entries * 2:
+        slots <<= 1
+    return slots
+
+
+def build_bundle(device_dir: Union[str, Path], bundle_path: Union[str, Path]) -> int:
+    """
+    Construir bundle a partir de certs/devices/{device_id}/device-{cert,key}.pem
+
+    Args:
+        device_dir: Directorio generado por scripts/generate_device_certs.ps1
+        bundle_path: Ruta del archivo bundle de salida
+
+    Returns:
+        Número de dispositivos empaquetados
+    """
+    device_dir = Path(device_dir)
+    bundle_path = Path(bundle_path)
+
+    entries: List[Tuple[bytes, bytes, bytes]] = []
+    with os.scandir(device_dir) as it:
+        for entry in sorted(it, key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            try:
+                cert = (Path(entry.path) / CERT_FILENAME).read_bytes()
+                key = (Path(entry.path) / KEY_FILENAME).read_bytes()
+            except FileNotFoundError:
+                continue
+            entries.append((entry.name.encode('utf-8'), cert, key))
+
+    slots = _slot_count(len(entries))
+    table: List[Optional[tuple]] = [None] * slots
+    data = bytearray()
+    data_start = _HEADER.size + slots * _SLOT.size
+
+    for device_id, cert, key in entries:
+        id_off = data_start + len(data)
+        data += device_id
+        cert_off = data_start + len(data)
+        data += cert
+        key_off = data_start + len(data)
+        data += key
+
+        h = _hash_device_id(device_id)
+        index = h & (slots - 1)
+        while table[index] is not None:
+            index = (index + 1) & (slots - 1)
+        table[index] = (h, id_off, len(device_id), cert_off, len(cert), key_off, len(key))
+
+    empty = _SLOT.pack(0, 0, 0, 0, 0, 0, 0)
+    tmp_path = bundle_path.with_name(bundle_path.name + '.tmp')
+    # El bundle contiene todas las claves privadas: 0600 sin depender del umask
+    # (un .tmp previo conservaría sus permisos con O_TRUNC, por eso se elimina)
+    tmp_path.unlink(missing_ok=True)
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(BUNDLE_MAGIC, slots, len(entries)))
+            f.write(b''.join(_SLOT.pack(*slot) if slot else empty for slot in table))
+            f.write(data)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, bundle_path)
+
+    return len(entries)
+
+
+class CertBundleStore:
+    """
+    Almacén de solo lectura sobre un bundle de certificados.
+    El archivo se abre y mapea en memoria en la primera búsqueda.
+    """
+
+    def __init__(self, bundle_path: Union[str, Path]):
+        """
+        Args:
+            bundle_path: Ruta al bundle generado por scripts/build_cert_bundle.py
+        """
+        self.bundle_path = Path(bundle_path)
+        self._file = None
+        self._mmap = None
+        self._slots = 0
+        self._entries = 0
+        self._materialized: Dict[str, Tuple[Path, Path]] = {}
+        self._cleanups: List[weakref.finalize] = []
+
+    def _open(self):
+        """Abrir y validar el bundle (carga diferida)"""
+        if self._mmap is not None:
+            return
+
+        self._file = open(self.bundle_path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            self._file = None
+            raise ValueError(f"Bundle de certificados vacío: {self.bundle_path}")
+
+        if len(self._mmap) < _HEADER.size:
+            self._invalid()
+        magic, slots, entries = _HEADER.unpack_from(self._mmap, 0)
+        if (magic != BUNDLE_MAGIC or slots == 0 or slots & (slots - 1)
+                or len(self._mmap) < _HEADER.size + slots * _SLOT.size):
+            self._invalid()
+        self._slots = slots
+        self._entries = entries
+
+    def _invalid(self):
+        """Cerrar y rechazar un bundle truncado o corrupto"""
+        self.close()
+        raise ValueError(f"Bundle de certificados inválido: {self.bundle_path}")
+
+    def lookup(self, device_id: str) -> Optional[Tuple[bytes, bytes]]:
+        """
+        Buscar el par certificado/clave de un dispositivo
+
+        Args:
+            device_id: Identificador del dispositivo (Thing ID)
+
+        Returns:
+            Tupla (certificado PEM, clave PEM) o None si no existe
+        """
+        self._open()
+        key = device_id.encode('utf-8')
+        h = _hash_device_id(key)
+        mask = self._slots - 1
+        index = h & mask
+        size = len(self._mmap)
+
+        for _ in range(self._slots):
+            slot_hash, id_off, id_len, cert_off, cert_len, key_off, key_len = \
+                _SLOT.unpack_from(self._mmap, _HEADER.size + index * _SLOT.size)
+            if id_len == 0:
+                return None
+            # Un offset fuera del archivo devolvería un PEM truncado sin error
+            if (id_off + id_len > size or cert_off + cert_len > size
+                    or key_off + key_len > size):
+                self._invalid()
+            if slot_hash == h and self._mmap[id_off:id_off + id_len] == key:
+                return (self._mmap[cert_off:cert_off + cert_len],
+                        self._mmap[key_off:key_off + key_len])
+            index = (index + 1) & mask
+
+        return None
+
+    def materialize(self, device_id: str) -> Tuple[Path, Path]:
+        """
+        Exponer el par del dispositivo como rutas de archivo privadas.
+        TLS (ssl/paho y el SDK de Azure) solo acepta rutas de archivo.
+
+        En Linux se usan archivos anónimos en memoria (memfd_create) vistos
+        como /proc/self/fd/N: no tocan el disco y el kernel los libera aunque
+        el proceso muera con SIGKILL. Sin memfd se usa /dev/shm si existe y,
+        en otros sistemas, un directorio temporal borrado en close()/salida.
+
+        Args:
+            device_id: Identificador del dispositivo (Thing ID)
+
+        Returns:
+            Tupla (ruta del certificado, ruta de la clave privada)
+        """
+        if device_id not in self._materialized:
+            pair = self.lookup(device_id)
+            if pair is None:
+                raise FileNotFoundError(
+                    f"Dispositivo {device_id} no encontrado en bundle: {self.bundle_path}")
+
+            if hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd'):
+                paths = self._materialize_memfd(pair)
+            else:
+                paths = self._materialize_tempdir(device_id, pair)
+            self._materialized[device_id] = paths
+
+        return self._materialized[device_id]
+
+    def _materialize_memfd(self, pair: Tuple[bytes, bytes]) -> Tuple[Path, Path]:
+        """Escribir el par en memfds; se cierran en close() o al terminar el proceso"""
+        paths = []
+        for filename, content in zip((CERT_FILENAME, KEY_FILENAME), pair):
+            fd = os.memfd_create(filename)
+            with os.fdopen(fd, 'wb', closefd=False) as f:
+                f.write(content)
+            self._cleanups.append(weakref.finalize(self, os.close, fd))
+            paths.append(Path(f'/proc/self/fd/{fd}'))
+        return paths[0], paths[1]
+
+    def _materialize_tempdir(self, device_id: str, pair: Tuple[bytes, bytes]) -> Tuple[Path, Path]:
+        """Escribir el par en un directorio 0700 (en RAM si hay /dev/shm)"""
+        base = _SHM_DIR if os.path.isdir(_SHM_DIR) else None
+        directory = Path(tempfile.mkdtemp(prefix=f'iot-{device_id}-', dir=base))
+        for filename, content in zip((CERT_FILENAME, KEY_FILENAME), pair):
+            fd = os.open(directory / filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+        # Borrar la clave también si el proceso termina sin close()
+        self._cleanups.append(weakref.finalize(self, shutil.rmtree, directory, True))
+        return directory / CERT_FILENAME, directory / KEY_FILENAME
+
+    def labels(self, device_id: str) -> Tuple[str, str]:
+        """
+        Nombres legibles del par para mostrar en consola (las rutas
+        materializadas, p. ej. /proc/self/fd/5, no identifican el origen)
+
+        Returns:
+            Tupla ('devices.bundle#thing_003/device-cert.pem', '...device-key.pem')
+        """
+        prefix = f"{self.bundle_path.name}#{device_id}"
+        return f"{prefix}/{CERT_FILENAME}", f"{prefix}/{KEY_FILENAME}"
+
+    def close(self):
+        """Cerrar el mapeo y liberar los pares materializados"""
+        for cleanup in self._cleanups:
+            cleanup()
+        self._cleanups.clear()
+        self._materialized.clear()
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __contains__(self, device_id: str) -> bool:
+        return self.lookup(device_id) is not None
+
+    def __len__(self) -> int:
+        self._open()
+        return self._entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
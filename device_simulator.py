@@ -11,25 +11,56 @@ import time
 import random
 import datetime
 from pathlib import Path
-from dotenv import load_dotenv
 
-try:
-    from azure.iot.device import IoTHubDeviceClient, Message
-    from azure.iot.device import X509
-    from colorama import Fore, Style, init
-    init(autoreset=True)
-except ImportError as e:
+# Heavy dependencies (Azure IoT SDK, colorama, dotenv) are imported on first
+# use so that worker processes start fast
+IoTHubDeviceClient = Message = X509 = None
+LINK_ERRORS = ()
+Fore = Style = None
+
+
+def _missing_dependency(e):
+    """Abort with installation instructions"""
     print(f"Error: Missing required package. Run: pip install -r requirements.txt")
     print(f"Details: {e}")
     sys.exit(1)
 
-# Load environment variables
-load_dotenv()
+
+def _load_console():
+    """Initialize colorama and load environment variables (.env)"""
+    global Fore, Style
+    if Fore is not None:
+        return
+    try:
+        from colorama import Fore as _Fore, Style as _Style, init
+        from dotenv import load_dotenv
+    except ImportError as e:
+        _missing_dependency(e)
+    init(autoreset=True)
+    load_dotenv()
+    Fore, Style = _Fore, _Style
+
+
+def _load_azure():
+    """Import the Azure IoT device SDK when the first client is created"""
+    global IoTHubDeviceClient, Message, X509, LINK_ERRORS
+    if IoTHubDeviceClient is not None:
+        return
+    try:
+        from azure.iot.device import IoTHubDeviceClient as _Client, Message as _Message
+        from azure.iot.device import X509 as _X509
+        from azure.iot.device.exceptions import (ConnectionDroppedError, ConnectionFailedError,
+                                                 NoConnectionError, OperationTimeout)
+    except ImportError as e:
+        _missing_dependency(e)
+    IoTHubDeviceClient, Message, X509 = _Client, _Message, _X509
+    LINK_ERRORS = (ConnectionDroppedError, ConnectionFailedError, NoConnectionError, OperationTimeout)
 
 class DeviceSimulator:
     """Simulates an IoT device with telemetry generation"""
     
-    def __init__(self, device_id=None, cert_path=None, key_path=None):
+    def __init__(self, device_id=None, cert_path=None, key_path=None, rate_controller=None,
+                 profiler=None, hostname=None, ca_path=None):
         """
         Initialize device simulator
         
@@ -37,23 +68,41 @@ class DeviceSimulator:
             device_id: Device identifier (thing_001, thing_002, etc.)
             cert_path: Path to device certificate
             key_path: Path to device private key
+            rate_controller: Optional AdaptiveRateController (default: from IOTHUB_TIER)
+            profiler: Optional StageProfiler (default: from PROFILE_STAGES)
+            hostname: IoT Hub hostname (default: from IOTHUB_HOSTNAME)
+            ca_path: CA that signed the server certificate, e.g. a local test
+                broker (default: from CA_PATH, otherwise the SDK's bundled roots)
         """
+        _load_console()
+        
         self.device_id = device_id or os.getenv('DEVICE_ID', 'thing_001')
-        self.hostname = os.getenv('IOTHUB_HOSTNAME')
+        self.hostname = hostname or os.getenv('IOTHUB_HOSTNAME')
         
         if not self.hostname:
             raise ValueError("IOTHUB_HOSTNAME not set in environment")
         
         # Certificate paths
         base_dir = Path(__file__).parent
-        self.cert_path = cert_path or os.getenv('CERT_PATH', 
-            f'certs/devices/{self.device_id}/device-cert.pem')
-        self.key_path = key_path or os.getenv('KEY_PATH', 
-            f'certs/devices/{self.device_id}/device-key.pem')
+        bundle_path = os.getenv('CERT_BUNDLE')
+        self.cert_store = None
         
-        # Make paths absolute
-        self.cert_path = base_dir / self.cert_path
-        self.key_path = base_dir / self.key_path
+        if bundle_path and not (cert_path or key_path):
+            # Indexed bundle: single O(1) lookup instead of per-device paths
+            from cert_bundle import CertBundleStore
+            self.cert_store = CertBundleStore(base_dir / bundle_path)
+            self.cert_path, self.key_path = self.cert_store.materialize(self.device_id)
+            self.cert_label = self.cert_store.labels(self.device_id)[0]
+        else:
+            self.cert_path = cert_path or os.getenv('CERT_PATH', 
+                f'certs/devices/{self.device_id}/device-cert.pem')
+            self.key_path = key_path or os.getenv('KEY_PATH', 
+                f'certs/devices/{self.device_id}/device-key.pem')
+            
+            # Make paths absolute
+            self.cert_path = base_dir / self.cert_path
+            self.key_path = base_dir / self.key_path
+            self.cert_label = self.cert_path.name
         
         # Verify certificate files exist
         if not self.cert_path.exists():
@@ -61,21 +110,42 @@ class DeviceSimulator:
         if not self.key_path.exists():
             raise FileNotFoundError(f"Private key not found: {self.key_path}")
         
+        ca_path = ca_path or os.getenv('CA_PATH')
+        self.ca_path = base_dir / ca_path if ca_path else None
+        
         self.client = None
         self.message_count = 0
+        self.stats = {
+            'messages_failed': 0,
+            'messages_offline': 0,
+            'messages_rate_limited': 0,
+        }
+        
+        # Adaptive rate control sized from the IoT Hub tier
+        self.rate_controller = rate_controller
+        if self.rate_controller is None and os.getenv('IOTHUB_TIER'):
+            from rate_control import rate_controller_from_env
+            self.rate_controller = rate_controller_from_env()
+        
+        # Opt-in hot-path stage timing
+        self.profiler = profiler
+        if self.profiler is None:
+            from stage_profiler import StageProfiler
+            self.profiler = StageProfiler.from_env()
         
         print(f"{Fore.CYAN}╔════════════════════════════════════════════════╗")
         print(f"{Fore.CYAN}║   Azure IoT Device Simulator - MQTT + X.509    ║")
         print(f"{Fore.CYAN}╚════════════════════════════════════════════════╝{Style.RESET_ALL}")
         print(f"📱 Device ID: {Fore.GREEN}{self.device_id}{Style.RESET_ALL}")
         print(f"🔗 IoT Hub: {Fore.GREEN}{self.hostname}{Style.RESET_ALL}")
-        print(f"🔐 Certificate: {Fore.YELLOW}{self.cert_path.name}{Style.RESET_ALL}")
+        print(f"🔐 Certificate: {Fore.YELLOW}{self.cert_label}{Style.RESET_ALL}")
         print()
     
     def connect(self):
         """Establish MQTT connection to Azure IoT Hub with X.509 authentication"""
         try:
             print(f"{Fore.YELLOW}🔌 Connecting to Azure IoT Hub...{Style.RESET_ALL}")
+            _load_azure()
             
             # Create X.509 authentication object
             x509 = X509(
@@ -84,10 +154,14 @@ class DeviceSimulator:
             )
             
             # Create IoT Hub client with X.509
+            kwargs = {}
+            if self.ca_path is not None:
+                kwargs['server_verification_cert'] = self.ca_path.read_text()
             self.client = IoTHubDeviceClient.create_from_x509_certificate(
                 hostname=self.hostname,
                 device_id=self.device_id,
-                x509=x509
+                x509=x509,
+                **kwargs
             )
             
             # Connect to IoT Hub
@@ -146,7 +220,14 @@ class DeviceSimulator:
         
         Args:
             payload: Dictionary with telemetry data
+            
+        Returns:
+            bool: True if the hub acknowledged the message
         """
+        prof = self.profiler
+        if prof:
+            t = prof.clock()
+        
         try:
             # Create message
             message = Message(json.dumps(payload))
@@ -160,16 +241,42 @@ class DeviceSimulator:
             # Add custom application properties
             message.custom_properties["deviceType"] = "bedside_monitor"
             message.custom_properties["priority"] = "normal"
+            if prof:
+                t = prof.lap('serialize', t)
             
             # Check for anomalies and flag
             if (payload['heartRate'] > 100 or payload['heartRate'] < 60 or
                 payload['spo2'] < 90 or payload['temperature'] > 37.5):
                 message.custom_properties["alert"] = "true"
                 message.custom_properties["priority"] = "high"
+            if prof:
+                t = prof.lap('alert', t)
+            
+            # Wait for rate budget (send_message blocks until PUBACK, so in-flight is 1)
+            if self.rate_controller is not None:
+                if not self.rate_controller.acquire(timeout=10):
+                    print(f"{Fore.RED}❌ Rate limited: no send budget within 10s{Style.RESET_ALL}")
+                    self.stats['messages_failed'] += 1
+                    self.stats['messages_rate_limited'] += 1
+                    return False
+                if prof:
+                    t = prof.lap('rate_wait', t)
             
             # Send message
-            self.client.send_message(message)
+            sent_at = time.monotonic()
+            try:
+                self.client.send_message(message)
+            except LINK_ERRORS:
+                # Dropped connection or timeout: only a throttling signal if the link was congested
+                self.stats['messages_offline'] += 1
+                if self.rate_controller is not None:
+                    self.rate_controller.on_disconnect()
+                raise
+            if self.rate_controller is not None:
+                self.rate_controller.record_latency(time.monotonic() - sent_at)
             self.message_count += 1
+            if prof:
+                t = prof.lap('publish', t)
             
             # Display message
             timestamp = datetime.datetime.now().strftime("%H:%M:%S")
@@ -181,9 +288,15 @@ class DeviceSimulator:
                 print(f"{Fore.GREEN}✅ [{timestamp}] Message #{self.message_count}{Style.RESET_ALL}")
             
             print(f"   HR: {payload['heartRate']} bpm | SpO2: {payload['spo2']}% | Temp: {payload['temperature']}°C")
+            if prof:
+                prof.lap('console', t)
+            
+            return True
             
         except Exception as e:
             print(f"{Fore.RED}❌ Failed to send message: {e}{Style.RESET_ALL}")
+            self.stats['messages_failed'] += 1
+            return False
     
     def run(self, interval=None):
         """
@@ -202,8 +315,16 @@ class DeviceSimulator:
         try:
             while True:
                 # Generate and send telemetry
+                prof = self.profiler
+                if prof:
+                    prof.message_start()
+                    t = prof.clock()
                 telemetry = self.generate_telemetry()
+                if prof:
+                    prof.lap('generate', t)
                 self.send_message(telemetry)
+                if prof:
+                    prof.message_end()
                 
                 # Wait for next interval
                 time.sleep(interval)
@@ -223,11 +344,26 @@ class DeviceSimulator:
                 self.client.disconnect()
                 print(f"{Fore.GREEN}✅ Disconnected from Azure IoT Hub{Style.RESET_ALL}")
                 print(f"📊 Total messages sent: {self.message_count}")
+                if self.rate_controller is not None:
+                    rate = self.rate_controller.snapshot()
+                    print(f"🚦 Adaptive rate: {rate['rate']:.2f}/{rate['max_rate']:.2f} msg/s "
+                          f"| decreases: {rate['decreases']} | throttling: {rate['throttle_events']} "
+                          f"| disconnects: {rate['disconnects']}")
+                if self.profiler is not None:
+                    print(f"⏱️  Stage timing:")
+                    for line in self.profiler.format_table():
+                        print(line)
         except Exception as e:
             print(f"{Fore.RED}❌ Error during disconnect: {e}{Style.RESET_ALL}")
+        finally:
+            if self.cert_store is not None:
+                self.cert_store.close()
+            if self.profiler is not None:
+                self.profiler.close()
 
 def main():
     """Main entry point"""
+    _load_console()
     
     # Allow override via command line
     device_id = sys.argv[1] if len(sys.argv) > 1 else None
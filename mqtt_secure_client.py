@@ -14,23 +14,48 @@ import json
 import time
 import random
 import datetime
-import ssl
 import threading
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-try:
-    import paho.mqtt.client as mqtt
-    from colorama import Fore, Style, init
-    from dotenv import load_dotenv
-    init(autoreset=True)
-except ImportError as e:
+# Dependencias pesadas (paho, ssl, colorama, dotenv): se importan en el
+# primer uso para que los procesos worker arranquen rápido
+mqtt = None
+Fore = Style = None
+
+
+def _missing_dependency(e: ImportError):
+    """Abortar indicando cómo instalar las dependencias"""
     print(f"Error: Falta instalar dependencias. Ejecute: pip install -r requirements.txt")
     print(f"Detalle: {e}")
     sys.exit(1)
 
-# Cargar variables de entorno
-load_dotenv()
+
+def _load_console():
+    """Inicializar colorama y cargar variables de entorno (.env)"""
+    global Fore, Style
+    if Fore is not None:
+        return
+    try:
+        from colorama import Fore as _Fore, Style as _Style, init
+        from dotenv import load_dotenv
+    except ImportError as e:
+        _missing_dependency(e)
+    init(autoreset=True)
+    load_dotenv()
+    Fore, Style = _Fore, _Style
+
+
+def _load_mqtt():
+    """Importar paho-mqtt al construir el primer cliente"""
+    global mqtt
+    if mqtt is not None:
+        return
+    try:
+        import paho.mqtt.client as _mqtt
+    except ImportError as e:
+        _missing_dependency(e)
+    mqtt = _mqtt
 
 
 class SecureIoTClient:
@@ -40,7 +65,9 @@ class SecureIoTClient:
     """
     
     def __init__(self, device_id: str, cert_path: str, key_path: str, 
-                 hostname: str, port: int = 8883):
+                 hostname: str, port: int = 8883, ca_path: Optional[str] = None,
+                 rate_controller=None, profiler=None,
+                 cert_label: Optional[str] = None, key_label: Optional[str] = None):
         """
         Inicializar cliente IoT seguro
         
@@ -50,12 +77,22 @@ class SecureIoTClient:
             key_path: Ruta a la clave privada del dispositivo
             hostname: Hostname del servidor IoT (ej: iothub.azure-devices.net)
             port: Puerto MQTT sobre TLS (default: 8883)
+            ca_path: CA para validar el servidor (default: CAs del sistema)
+            rate_controller: AdaptiveRateController opcional (rate_control.py)
+            profiler: StageProfiler opcional (stage_profiler.py)
+            cert_label: Nombre mostrado del certificado (default: nombre del archivo)
+            key_label: Nombre mostrado de la clave (default: nombre del archivo)
         """
         self.device_id = device_id
         self.hostname = hostname
         self.port = port
         self.cert_path = Path(cert_path)
         self.key_path = Path(key_path)
+        self.cert_label = cert_label or self.cert_path.name
+        self.key_label = key_label or self.key_path.name
+        self.ca_path = ca_path
+        self.rate_controller = rate_controller
+        self.profiler = profiler
         
         # Validar archivos de certificados
         if not self.cert_path.exists():
@@ -67,20 +104,20 @@ class SecureIoTClient:
         self.connected = False
         self.message_count = 0
         self.last_message_time = None
+        self._connected_event = threading.Event()
         
-        # Cliente MQTT
+        # Cliente MQTT (se construye en el primer connect())
         self.client = None
-        self._setup_mqtt_client()
         
         # Estadísticas
         self.stats = {
             'messages_sent': 0,
             'messages_failed': 0,
+            'messages_offline': 0,
+            'messages_rate_limited': 0,
             'connection_attempts': 0,
             'last_error': None
         }
-        
-        self._print_header()
     
     def _print_header(self):
         """Imprimir encabezado informativo"""
@@ -90,13 +127,16 @@ class SecureIoTClient:
         print()
         print(f"📱 {Fore.YELLOW}Device ID:{Style.RESET_ALL}     {Fore.GREEN}{self.device_id}{Style.RESET_ALL}")
         print(f"🌐 {Fore.YELLOW}Servidor IoT:{Style.RESET_ALL}  {Fore.GREEN}{self.hostname}:{self.port}{Style.RESET_ALL}")
-        print(f"🔐 {Fore.YELLOW}Certificado:{Style.RESET_ALL}   {Fore.CYAN}{self.cert_path.name}{Style.RESET_ALL}")
-        print(f"🔑 {Fore.YELLOW}Clave privada:{Style.RESET_ALL} {Fore.CYAN}{self.key_path.name}{Style.RESET_ALL}")
+        print(f"🔐 {Fore.YELLOW}Certificado:{Style.RESET_ALL}   {Fore.CYAN}{self.cert_label}{Style.RESET_ALL}")
+        print(f"🔑 {Fore.YELLOW}Clave privada:{Style.RESET_ALL} {Fore.CYAN}{self.key_label}{Style.RESET_ALL}")
         print(f"🔒 {Fore.YELLOW}Protocolo:{Style.RESET_ALL}     {Fore.GREEN}MQTT v3.1.1 sobre TLS 1.2+{Style.RESET_ALL}")
         print()
     
     def _setup_mqtt_client(self):
         """Configurar cliente MQTT con TLS y certificados X.509"""
+        import ssl
+        _load_mqtt()
+        
         # Crear cliente MQTT con ID único
         client_id = self.device_id
         self.client = mqtt.Client(
@@ -114,6 +154,7 @@ class SecureIoTClient:
         
         # Configurar autenticación con certificados X.509
         self.client.tls_set(
+            ca_certs=self.ca_path,
             certfile=str(self.cert_path),
             keyfile=str(self.key_path),
             cert_reqs=ssl.CERT_REQUIRED,
@@ -153,6 +194,7 @@ class SecureIoTClient:
             self.client.subscribe(c2d_topic, qos=1)
             print(f"{Fore.CYAN}📥 Suscrito a mensajes C2D: {c2d_topic}{Style.RESET_ALL}")
             print()
+            self._connected_event.set()
         else:
             self.connected = False
             error_messages = {
@@ -166,19 +208,27 @@ class SecureIoTClient:
             print(f"{Fore.RED}❌ Error de conexión: {error_msg}{Style.RESET_ALL}")
             self.stats['last_error'] = error_msg
             self.stats['connection_attempts'] += 1
+            # Despertar connect() sin esperar el timeout completo
+            self._connected_event.set()
     
     def _on_disconnect(self, client, userdata, rc):
         """Callback ejecutado al desconectarse del broker"""
         self.connected = False
+        self._connected_event.clear()
         if rc == 0:
             print(f"{Fore.YELLOW}🔌 Desconexión limpia del servidor{Style.RESET_ALL}")
         else:
+            # IoT Hub cierra la conexión al aplicar throttling, pero también caen el Wi-Fi o el keepalive
+            if self.rate_controller is not None:
+                self.rate_controller.on_disconnect()
             print(f"{Fore.RED}⚠️  Desconexión inesperada (código {rc}){Style.RESET_ALL}")
             print(f"{Fore.YELLOW}🔄 Intentando reconexión...{Style.RESET_ALL}")
     
     def _on_publish(self, client, userdata, mid):
-        """Callback ejecutado cuando se publica un mensaje"""
+        """Callback ejecutado cuando se publica un mensaje (PUBACK en QoS 1)"""
         self.stats['messages_sent'] += 1
+        if self.rate_controller is not None:
+            self.rate_controller.on_puback(mid)
     
     def _on_message(self, client, userdata, msg):
         """
@@ -215,25 +265,33 @@ class SecureIoTClient:
         Returns:
             True si la conexión fue exitosa
         """
+        # Inicialización diferida: consola, encabezado y cliente MQTT
+        if self.client is None:
+            _load_console()
+            self._print_header()
+            self._setup_mqtt_client()
+        
         try:
             print(f"{Fore.YELLOW}🔌 Conectando a {self.hostname}:{self.port}...{Style.RESET_ALL}")
             print(f"{Fore.YELLOW}⏳ Estableciendo conexión TLS...{Style.RESET_ALL}")
             
             self.stats['connection_attempts'] += 1
+            self._connected_event.clear()
             self.client.connect(self.hostname, self.port, keepalive)
             
             # Iniciar loop en background
             self.client.loop_start()
             
-            # Esperar conexión (máximo 10 segundos)
+            # Esperar CONNACK (máximo 10 segundos) sin sondeo periódico
             timeout = 10
-            elapsed = 0
-            while not self.connected and elapsed < timeout:
-                time.sleep(0.5)
-                elapsed += 0.5
+            if not self._connected_event.wait(timeout):
+                print(f"{Fore.RED}❌ Timeout: No se pudo conectar en {timeout}s{Style.RESET_ALL}")
+                return False
             
+            # CONNACK recibido pero rechazado (rc != 0) o conexión cerrada antes de tiempo
             if not self.connected:
-                print(f"{Fore.RED}❌ Timeout: No se pudo conectar en {timeout}s{Style.RESET_ALL}")
+                reason = self.stats['last_error'] or "conexión cerrada tras el CONNACK"
+                print(f"{Fore.RED}❌ Conexión rechazada: {reason}{Style.RESET_ALL}")
                 return False
             
             return True
@@ -253,6 +311,10 @@ class SecureIoTClient:
                 self.print_stats()
         except Exception as e:
             print(f"{Fore.RED}❌ Error al desconectar: {e}{Style.RESET_ALL}")
+        finally:
+            # Guardar el resumen JSON de perfilado (si se configuró)
+            if self.profiler is not None:
+                self.profiler.close()
     
     def send_telemetry(self, data: Dict[str, Any]) -> bool:
         """
@@ -265,10 +327,26 @@ class SecureIoTClient:
             True si el mensaje se envió exitosamente
         """
         if not self.connected:
+            _load_console()
             print(f"{Fore.RED}❌ No conectado - no se puede enviar mensaje{Style.RESET_ALL}")
             self.stats['messages_failed'] += 1
+            self.stats['messages_offline'] += 1
             return False
         
+        prof = self.profiler
+        if prof:
+            t = prof.clock()
+        
+        # Control adaptativo de tasa: esperar cupo y mensajes en vuelo
+        if self.rate_controller is not None:
+            if not self.rate_controller.acquire(timeout=10):
+                print(f"{Fore.RED}❌ Límite de tasa: sin cupo para enviar en 10s{Style.RESET_ALL}")
+                self.stats['messages_failed'] += 1
+                self.stats['messages_rate_limited'] += 1
+                return False
+            if prof:
+                t = prof.lap('rate_wait', t)
+        
         try:
             # Topic para mensajes D2C en Azure IoT Hub
             topic = f"devices/{self.device_id}/messages/events/"
@@ -284,23 +362,45 @@ class SecureIoTClient:
             # Serializar a JSON
             payload = json.dumps(message_data)
             
+            if prof:
+                t = prof.lap('serialize', t)
+            
             # Publicar con QoS 1 (at least once delivery)
-            result = self.client.publish(
-                topic=topic,
-                payload=payload,
-                qos=1,
-                retain=False
-            )
+            if self.rate_controller is not None:
+                self.rate_controller.begin_publish()
+            sent_at = time.monotonic()
+            try:
+                result = self.client.publish(
+                    topic=topic,
+                    payload=payload,
+                    qos=1,
+                    retain=False
+                )
+            except Exception:
+                if self.rate_controller is not None:
+                    self.rate_controller.end_publish()
+                raise
+            if prof:
+                t = prof.lap('publish', t)
+            
+            # Con MQTT_ERR_NO_CONN paho igual encola el mensaje y lo envía al reconectar
+            if self.rate_controller is not None:
+                if result.rc in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                    self.rate_controller.track(result.mid, sent_at)
+                else:
+                    self.rate_controller.end_publish()
             
             # Verificar resultado
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 self.message_count += 1
                 self.last_message_time = datetime.datetime.now()
                 
-                timestamp = self.last_message_time.strftime("%H:%M:%S")
-                
                 # Detectar alertas
                 is_alert = self._is_alert(data)
+                if prof:
+                    t = prof.lap('alert', t)
+                
+                timestamp = self.last_message_time.strftime("%H:%M:%S")
                 
                 if is_alert:
                     print(f"{Fore.RED}⚠️  [{timestamp}] Mensaje #{self.message_count} (ALERTA){Style.RESET_ALL}")
@@ -309,6 +409,8 @@ class SecureIoTClient:
                 
                 # Mostrar datos de forma compacta
                 self._print_telemetry(data)
+                if prof:
+                    prof.lap('console', t)
                 
                 return True
             else:
@@ -405,6 +507,7 @@ class SecureIoTClient:
             interval: Segundos entre mensajes
             duration: Duración total en segundos (None = infinito)
         """
+        _load_console()
         print(f"{Fore.CYAN}🚀 Iniciando simulación de telemetría{Style.RESET_ALL}")
         print(f"{Fore.CYAN}⏱️  Intervalo: {interval}s | Duración: {'∞' if duration is None else f'{duration}s'}{Style.RESET_ALL}")
         print(f"{Fore.CYAN}Press Ctrl+C para detener{Style.RESET_ALL}")
@@ -422,8 +525,16 @@ class SecureIoTClient:
                     break
                 
                 # Generar y enviar telemetría
+                prof = self.profiler
+                if prof:
+                    prof.message_start()
+                    t = prof.clock()
                 telemetry = self.generate_vital_signs()
+                if prof:
+                    prof.lap('generate', t)
                 self.send_telemetry(telemetry)
+                if prof:
+                    prof.message_end()
                 
                 # Esperar intervalo
                 time.sleep(interval)
@@ -437,6 +548,7 @@ class SecureIoTClient:
     
     def print_stats(self):
         """Imprimir estadísticas de la sesión"""
+        _load_console()
         print()
         print(f"{Fore.CYAN}╔════════════════════════════════════════════════════════════╗")
         print(f"{Fore.CYAN}║                  Estadísticas de Sesión                    ║")
@@ -449,24 +561,41 @@ class SecureIoTClient:
         if self.last_message_time:
             print(f"⏱️  {Fore.YELLOW}Último mensaje:{Style.RESET_ALL}        {self.last_message_time.strftime('%H:%M:%S')}")
         
+        if self.rate_controller is not None:
+            rate = self.rate_controller.snapshot()
+            print(f"🚦 {Fore.YELLOW}Tasa adaptativa:{Style.RESET_ALL}      {rate['rate']:.2f}/{rate['max_rate']:.2f} msg/s "
+                  f"| reducciones: {rate['decreases']} | throttling: {rate['throttle_events']} "
+                  f"| desconexiones: {rate['disconnects']}")
+        
         if self.stats['last_error']:
             print(f"⚠️  {Fore.YELLOW}Último error:{Style.RESET_ALL}          {Fore.RED}{self.stats['last_error']}{Style.RESET_ALL}")
         
+        if self.profiler is not None:
+            print()
+            print(f"⏱️  {Fore.YELLOW}Tiempos por etapa:{Style.RESET_ALL}")
+            for line in self.profiler.format_table(
+                    headers=('etapa', 'n', 'media µs', 'p99 µs', '% total'),
+                    tracemalloc_note='tracemalloc activo: los tiempos incluyen el rastreo de memoria'):
+                print(line)
+        
         print()
 
 
 def main():
     """Punto de entrada principal"""
+    _load_console()
     
     # Configuración desde variables de entorno
     device_id = os.getenv('DEVICE_ID', 'thing_001')
     hostname = os.getenv('IOTHUB_HOSTNAME')
     port = int(os.getenv('MQTT_PORT', 8883))
+    ca_path = os.getenv('CA_PATH')
     
     # Paths de certificados
     base_dir = Path(__file__).parent
     cert_path = os.getenv('CERT_PATH', f'certs/devices/{device_id}/device-cert.pem')
     key_path = os.getenv('KEY_PATH', f'certs/devices/{device_id}/device-key.pem')
+    bundle_path = os.getenv('CERT_BUNDLE')
     
     cert_path = base_dir / cert_path
     key_path = base_dir / key_path
@@ -477,14 +606,38 @@ def main():
         print(f"{Fore.YELLOW}Ejemplo: IOTHUB_HOSTNAME=iothub-parcial-2025.azure-devices.net{Style.RESET_ALL}")
         sys.exit(1)
     
+    store = None
+    cert_label = key_label = None
     try:
+        # Bundle indexado: una sola búsqueda O(1) en lugar de rutas por dispositivo
+        if bundle_path:
+            from cert_bundle import CertBundleStore
+            store = CertBundleStore(base_dir / bundle_path)
+            cert_path, key_path = store.materialize(device_id)
+            cert_label, key_label = store.labels(device_id)
+        
+        # Control adaptativo de tasa dimensionado según el tier del hub
+        rate_controller = None
+        if os.getenv('IOTHUB_TIER'):
+            from rate_control import rate_controller_from_env
+            rate_controller = rate_controller_from_env()
+        
+        # Perfilado opcional del camino crítico (None si PROFILE_STAGES no es 'true')
+        from stage_profiler import StageProfiler
+        profiler = StageProfiler.from_env()
+        
         # Crear cliente IoT seguro
         client = SecureIoTClient(
             device_id=device_id,
             cert_path=str(cert_path),
             key_path=str(key_path),
             hostname=hostname,
-            port=port
+            port=port,
+            ca_path=str(base_dir / ca_path) if ca_path else None,
+            rate_controller=rate_controller,
+            profiler=profiler,
+            cert_label=cert_label,
+            key_label=key_label
         )
         
         # Conectar al servidor
@@ -503,6 +656,8 @@ def main():
     except FileNotFoundError as e:
         print(f"{Fore.RED}❌ Error: {e}{Style.RESET_ALL}")
         print(f"{Fore.YELLOW}Genere certificados con: .\\scripts\\generate_device_certs.ps1{Style.RESET_ALL}")
+        if bundle_path:
+            print(f"{Fore.YELLOW}Reconstruya el bundle con: python scripts/build_cert_bundle.py{Style.RESET_ALL}")
         sys.exit(1)
     except Exception as e:
         print(f"{Fore.RED}❌ Error fatal: {e}{Style.RESET_ALL}")
@@ -515,6 +670,8 @@ def main():
             client.disconnect()
         except:
             pass
+        if store is not None:
+            store.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Control Adaptativo de Tasa - Token buckets por dispositivo y por flota
+Ajusta la tasa de envío con AIMD según la latencia de PUBACK, los mensajes
+en vuelo (QoS 1 sin confirmar) y las desconexiones por throttling del hub
+
+Autor: Universidad Militar Nueva Granada - Mecatrónica
+Proyecto: Comunicaciones IoT Seguras
+Fecha: Noviembre 2025
+"""
+
+import os
+import time
+import threading
+from typing import Optional, Dict, Any, Mapping
+
+# Cuotas de Azure IoT Hub por tier (mensajes D2C)
+#   per_unit_per_sec / min_per_sec: límite de throttling de envíos D2C
+#   per_unit_per_day: cuota diaria de mensajes por unidad
+HUB_TIERS = {
+    'F1': {'per_unit_per_sec': 100, 'min_per_sec': 100, 'per_unit_per_day': 8_000},
+    'B1': {'per_unit_per_sec': 12, 'min_per_sec': 100, 'per_unit_per_day': 400_000},
+    'B2': {'per_unit_per_sec': 120, 'min_per_sec': 100, 'per_unit_per_day': 6_000_000},
+    'B3': {'per_unit_per_sec': 6_000, 'min_per_sec': 6_000, 'per_unit_per_day': 300_000_000},
+    'S1': {'per_unit_per_sec': 12, 'min_per_sec': 100, 'per_unit_per_day': 400_000},
+    'S2': {'per_unit_per_sec': 120, 'min_per_sec': 100, 'per_unit_per_day': 6_000_000},
+    'S3': {'per_unit_per_sec': 6_000, 'min_per_sec': 6_000, 'per_unit_per_day': 300_000_000},
+}
+
+
+def hub_fleet_rate(tier: str, units: int = 1, sustained: bool = True) -> float:
+    """
+    Tasa máxima de mensajes/s para toda la flota según el tier del hub
+
+    Args:
+        tier: Tier de IoT Hub (F1, B1-B3, S1-S3)
+        units: Número de unidades del hub
+        sustained: Limitar también por la cuota diaria (tasa sostenible 24h)
+
+    Returns:
+        Mensajes por segundo permitidos
+    """
+    quota = HUB_TIERS.get(tier.upper())
+    if quota is None:
+        raise ValueError(f"Tier de IoT Hub desconocido: {tier}")
+    if units <= 0:
+        raise ValueError(f"Unidades de IoT Hub inválidas: {units} (deben ser > 0)")
+
+    rate = max(quota['min_per_sec'], quota['per_unit_per_sec'] * units)
+    if sustained:
+        rate = min(rate, quota['per_unit_per_day'] * units / 86_400)
+    return float(rate)
+
+
+class TokenBucket:
+    """Token bucket thread-safe con tasa ajustable"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens por segundo
+            burst: Capacidad máxima (default: 1 segundo de tasa, mínimo 1)
+        """
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate: float):
+        """Cambiar la tasa conservando los tokens acumulados"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def try_consume(self, tokens: float = 1.0) -> float:
+        """
+        Consumir tokens si hay disponibles
+
+        Returns:
+            0.0 si se consumieron; si no, segundos hasta que haya suficientes
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def refund(self, tokens: float = 1.0):
+        """Devolver tokens consumidos que finalmente no se usaron"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+
+class AdaptiveRateController:
+    """
+    Controlador AIMD de tasa de envío para un dispositivo.
+    Varios controladores pueden compartir un mismo TokenBucket de flota.
+    """
+
+    def __init__(self, max_rate: float, fleet_bucket: Optional[TokenBucket] = None,
+                 max_inflight: int = 10, min_rate: Optional[float] = None,
+                 increase_step: Optional[float] = None, increase_interval: float = 1.0,
+                 decrease_factor: float = 0.5, throttle_factor: float = 0.25,
+                 latency_factor: float = 2.0, latency_floor: float = 0.02,
+                 cooldown: float = 1.0):
+        """
+        Args:
+            max_rate: Techo de mensajes/s para el dispositivo
+            fleet_bucket: Bucket compartido por toda la flota (None = sin límite global)
+            max_inflight: Máximo de mensajes QoS 1 sin PUBACK
+            min_rate: Piso de la tasa (default: 1% del techo)
+            increase_step: Incremento aditivo por intervalo (default: 5% del techo)
+            increase_interval: Segundos sin congestión entre incrementos
+            decrease_factor: Factor multiplicativo ante latencia o en vuelo altos
+            throttle_factor: Factor multiplicativo ante throttling (o desconexión con congestión)
+            latency_factor: Congestión si latencia EWMA > base × factor (+ 4 × variación)
+            latency_floor: Margen mínimo (s) sobre la base antes de reaccionar
+            cooldown: Segundos mínimos entre reducciones consecutivas
+        """
+        if max_rate <= 0:
+            raise ValueError(f"Tasa máxima inválida: {max_rate} (debe ser > 0)")
+        self.max_rate = float(max_rate)
+        self.min_rate = min_rate if min_rate is not None else self.max_rate * 0.01
+        self.increase_step = increase_step if increase_step is not None else self.max_rate * 0.05
+        self.increase_interval = increase_interval
+        self.decrease_factor = decrease_factor
+        self.throttle_factor = throttle_factor
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor
+        self.cooldown = cooldown
+        self.max_inflight = max_inflight
+
+        self.fleet_bucket = fleet_bucket
+        self.rate = self.max_rate * 0.5
+        # Ráfaga menor que la ventana en vuelo para no saturarla al arrancar
+        self._bucket = TokenBucket(self.rate, burst=max(1.0, max_inflight / 2))
+
+        self._cond = threading.Condition()
+        self._inflight: Dict[int, float] = {}
+        self._resent = set()
+        self._early_acks = set()
+        self._publishing = 0
+        self._latency_ewma: Optional[float] = None
+        self._latency_base: Optional[float] = None
+        self._latency_var = 0.0
+        self._last_change = time.monotonic()
+        self._last_decrease = float('-inf')
+
+        self.stats = {
+            'acquired': 0,
+            'wait_time': 0.0,
+            'decreases': 0,
+            'throttle_events': 0,
+            'disconnects': 0,
+            'max_inflight_seen': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # AIMD
+    # ------------------------------------------------------------------
+
+    def _set_rate(self, rate: float, now: float):
+        self.rate = max(self.min_rate, min(self.max_rate, rate))
+        self._bucket.set_rate(self.rate)
+        self._last_change = now
+
+    def _decrease(self, factor: float, now: float):
+        # Como máximo una reducción por RTT (latencia suavizada) o por cooldown
+        if now - self._last_decrease < max(self.cooldown, self._latency_ewma or 0.0):
+            return
+        self._last_decrease = now
+        self.stats['decreases'] += 1
+        self._set_rate(self.rate * factor, now)
+
+    def _maybe_increase(self, now: float):
+        if self.rate < self.max_rate and now - self._last_change >= self.increase_interval:
+            self._set_rate(self.rate + self.increase_step, now)
+
+    def _congested(self) -> bool:
+        if self._latency_ewma is None:
+            return False
+        # Margen de 4 × variación (como el RTO de TCP) para no confundir jitter con colas
+        threshold = max(self._latency_base * self.latency_factor,
+                        self._latency_base + self.latency_floor) + 4 * self._latency_var
+        return self._latency_ewma > threshold
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Bloquear hasta que se permita enviar un mensaje
+
+        Args:
+            timeout: Segundos máximos de espera (None = indefinido)
+
+        Returns:
+            True si se puede enviar, False si expiró el timeout
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    return False
+
+                # Backpressure: no superar los mensajes en vuelo permitidos
+                if len(self._inflight) >= self.max_inflight:
+                    self._decrease(self.decrease_factor, now)
+                    self._cond.wait(remaining)
+                    continue
+
+                if not self._congested():
+                    self._maybe_increase(now)
+
+                wait = self._bucket.try_consume()
+                if wait == 0.0 and self.fleet_bucket is not None:
+                    wait = self.fleet_bucket.try_consume()
+                    if wait:
+                        # Devolver el token del dispositivo: la flota no tiene cupo
+                        self._bucket.refund()
+                if wait == 0.0:
+                    self.stats['acquired'] += 1
+                    self.stats['wait_time'] += now - start
+                    return True
+
+                self._cond.wait(wait if remaining is None else min(wait, remaining))
+
+    def begin_publish(self):
+        """Avisar que un publish() está en curso: su PUBACK puede llegar antes que track()"""
+        with self._cond:
+            self._publishing += 1
+
+    def end_publish(self):
+        """Cerrar un begin_publish() cuyo mensaje no quedó encolado (sin track())"""
+        with self._cond:
+            self._end_publish()
+
+    def _end_publish(self):
+        self._publishing = max(0, self._publishing - 1)
+        if not self._publishing:
+            # Sin publish() en curso ningún PUBACK pendiente puede reclamarse
+            self._early_acks.clear()
+
+    def track(self, mid: int, sent_at: float):
+        """
+        Registrar un mensaje QoS 1 encolado y aún sin PUBACK (cierra begin_publish())
+
+        Args:
+            mid: Message ID devuelto por el cliente MQTT
+            sent_at: time.monotonic() justo antes de publicar
+        """
+        with self._cond:
+            if mid in self._early_acks:
+                # El PUBACK llegó antes de que publish() retornara
+                self._early_acks.discard(mid)
+                self._record_latency(time.monotonic() - sent_at)
+            else:
+                self._inflight[mid] = sent_at
+                self.stats['max_inflight_seen'] = max(self.stats['max_inflight_seen'],
+                                                      len(self._inflight))
+            self._end_publish()
+
+    def on_puback(self, mid: int):
+        """Registrar el PUBACK de un mensaje (callback on_publish de paho)"""
+        with self._cond:
+            sent_at = self._inflight.pop(mid, None)
+            if sent_at is None:
+                if self._publishing:
+                    self._early_acks.add(mid)
+                return
+            if mid in self._resent:
+                # Algoritmo de Karn: un mensaje reenviado no da una muestra de latencia fiable
+                self._resent.discard(mid)
+            else:
+                self._record_latency(time.monotonic() - sent_at)
+            self._cond.notify_all()
+
+    def record_latency(self, latency: float):
+        """Registrar la latencia de un envío síncrono (p. ej. SDK de Azure)"""
+        with self._cond:
+            self._record_latency(latency)
+
+    def _record_latency(self, latency: float):
+        if self._latency_ewma is None:
+            self._latency_ewma = self._latency_base = latency
+        else:
+            self._latency_var += 0.25 * (abs(latency - self._latency_ewma) - self._latency_var)
+            self._latency_ewma += 0.3 * (latency - self._latency_ewma)
+            # La base sigue el mínimo y se relaja lentamente hacia arriba
+            self._latency_base = min(latency, self._latency_base * 1.001)
+        if self._congested():
+            self._decrease(self.decrease_factor, time.monotonic())
+
+    def on_throttled(self):
+        """Registrar un error atribuible con certeza a throttling del hub"""
+        with self._cond:
+            self._throttled(time.monotonic())
+            self._cond.notify_all()
+
+    def on_disconnect(self):
+        """
+        Registrar una desconexión inesperada. MQTT 3.1.1 no informa la causa:
+        solo se trata como throttling si había congestión (ventana en vuelo
+        llena o latencia alta); una caída de Wi-Fi o de keepalive conserva la tasa
+        """
+        with self._cond:
+            self.stats['disconnects'] += 1
+            now = time.monotonic()
+            if len(self._inflight) >= self.max_inflight or self._congested():
+                self._throttled(now)
+            else:
+                self._requeue_inflight(now)
+            self._cond.notify_all()
+
+    def _throttled(self, now: float):
+        self.stats['throttle_events'] += 1
+        self._decrease(self.throttle_factor, now)
+        self._requeue_inflight(now)
+
+    def _requeue_inflight(self, now: float):
+        # Los mensajes en vuelo se reenvían tras reconectar (QoS 1): siguen
+        # ocupando la ventana, con el tiempo de envío reiniciado
+        for mid in self._inflight:
+            self._inflight[mid] = now
+        self._resent.update(self._inflight)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado actual del controlador"""
+        with self._cond:
+            return {
+                **self.stats,
+                'rate': self.rate,
+                'max_rate': self.max_rate,
+                'inflight': len(self._inflight),
+                'latency_ewma_ms': None if self._latency_ewma is None else self._latency_ewma * 1000,
+                'latency_base_ms': None if self._latency_base is None else self._latency_base * 1000,
+            }
+
+
+def rate_controller_for_tier(tier: str, units: int = 1, workers: int = 1,
+                             device_max_rate: Optional[float] = None,
+                             fleet_bucket: Optional[TokenBucket] = None,
+                             **kwargs) -> AdaptiveRateController:
+    """
+    Crear un controlador dimensionado a partir del tier de IoT Hub
+
+    Args:
+        tier: Tier de IoT Hub (F1, B1-B3, S1-S3)
+        units: Número de unidades del hub
+        workers: Procesos que comparten la cuota (cada uno recibe 1/workers)
+        device_max_rate: Techo por dispositivo (default: cuota del proceso)
+        fleet_bucket: Bucket de flota ya compartido por otros dispositivos del proceso
+        **kwargs: Parámetros adicionales de AdaptiveRateController
+
+    Returns:
+        Controlador listo para usar con un cliente
+    """
+    if workers <= 0:
+        raise ValueError(f"Número de workers inválido: {workers} (debe ser > 0)")
+    if device_max_rate is not None and device_max_rate <= 0:
+        raise ValueError(f"DEVICE_MAX_RATE inválido: {device_max_rate} (debe ser > 0)")
+    share = hub_fleet_rate(tier, units) / workers
+    if fleet_bucket is None:
+        fleet_bucket = TokenBucket(share)
+    max_rate = min(share, device_max_rate) if device_max_rate else share
+    return AdaptiveRateController(max_rate, fleet_bucket=fleet_bucket, **kwargs)
+
+
+def rate_controller_from_env(environ: Optional[Mapping[str, str]] = None
+                             ) -> Optional[AdaptiveRateController]:
+    """
+    Crear un controlador a partir de IOTHUB_TIER, IOTHUB_UNITS, FLEET_WORKERS
+    y DEVICE_MAX_RATE (las variables vacías cuentan como no definidas)
+
+    Args:
+        environ: Variables de entorno (default: os.environ)
+
+    Returns:
+        Controlador, o None si IOTHUB_TIER no está definido
+    """
+    environ = os.environ if environ is None else environ
+    tier = environ.get('IOTHUB_TIER')
+    if not tier:
+        return None
+    device_max_rate = environ.get('DEVICE_MAX_RATE')
+    return rate_controller_for_tier(
+        tier,
+        units=int(environ.get('IOTHUB_UNITS') or 1),
+        workers=int(environ.get('FLEET_WORKERS') or 1),
+        device_max_rate=float(device_max_rate) if device_max_rate else None
+    )
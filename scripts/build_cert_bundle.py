@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Build Certificate Bundle
+Packs certs/devices/{device_id}/device-{cert,key}.pem (generate_device_certs.ps1
+layout) into a single indexed bundle for CertBundleStore
+
+Usage:
+    python scripts/build_cert_bundle.py
+    python scripts/build_cert_bundle.py --device-dir certs/devices --output certs/devices.bundle
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cert_bundle import build_bundle, CertBundleStore
+
+
+def main():
+    """Main entry point"""
+    base_dir = Path(__file__).resolve().parent.parent
+
+    parser = argparse.ArgumentParser(description="Build indexed device certificate bundle")
+    parser.add_argument('--device-dir', default=str(base_dir / 'certs' / 'devices'),
+                        help="Directory with one sub-folder per device")
+    parser.add_argument('--output', default=str(base_dir / 'certs' / 'devices.bundle'),
+                        help="Bundle file to write")
+    args = parser.parse_args()
+
+    device_dir = Path(args.device_dir)
+    if not device_dir.is_dir():
+        print(f"❌ Device directory not found: {device_dir}")
+        print("Generate certificates with: .\\scripts\\generate_device_certs.ps1")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    count = build_bundle(device_dir, args.output)
+    elapsed = time.perf_counter() - start
+
+    with CertBundleStore(args.output) as store:
+        if len(store) != count:
+            print(f"❌ Bundle verification failed: {len(store)} != {count}")
+            sys.exit(1)
+
+    size = Path(args.output).stat().st_size
+    print(f"✅ Packed {count} devices into {args.output} ({size / 1024:.1f} KiB, {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Perfilado por Etapas - Tiempos del camino crítico de telemetría
+Mide cada etapa (generación, serialización, publish, alertas, consola) con
+reloj monotónico en nanosegundos y, opcionalmente, muestrea cProfile y
+snapshots de tracemalloc cada N mensajes
+
+Autor: Universidad Militar Nueva Granada - Mecatrónica
+Proyecto: Comunicaciones IoT Seguras
+Fecha: Noviembre 2025
+
+Uso en el camino crítico:
+    t = profiler.clock()
+    ...etapa...
+    t = profiler.lap('serialize', t)
+"""
+
+import os
+import json
+import math
+import time
+from array import array
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Mapping, Sequence
+
+
+class _StageStats:
+    """Acumulador de una etapa: media exacta y ventana circular para p99"""
+
+    __slots__ = ('count', 'total', 'samples', 'index')
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0
+        self.samples = array('q', bytes(8 * window))
+        self.index = 0
+
+
+class StageProfiler:
+    """
+    Perfilador de etapas de bajo costo (opt-in) para los clientes IoT
+    """
+
+    clock = staticmethod(time.perf_counter_ns)
+
+    def __init__(self, cprofile_every: int = 0, tracemalloc_every: int = 0,
+                 window: int = 10_000, json_path: Optional[str] = None):
+        """
+        Args:
+            cprofile_every: Perfilar con cProfile 1 de cada N mensajes (0 = desactivado)
+            tracemalloc_every: Tomar snapshot de memoria cada N mensajes (0 = desactivado)
+            window: Muestras recientes por etapa usadas para el p99
+            json_path: Archivo donde close() guarda el resumen en JSON
+        """
+        self.cprofile_every = cprofile_every
+        self.tracemalloc_every = tracemalloc_every
+        self.window = window
+        self.json_path = json_path
+
+        self._stages: Dict[str, _StageStats] = {}
+        self._messages = 0
+        self._profile = None
+        self._profiling = False
+        self._first_snapshot = None
+        self._last_snapshot = None
+        self._skipped = 0
+        # tracemalloc encarece cada asignación: los tiempos dejan de ser representativos
+        self.tracemalloc_active = bool(tracemalloc_every)
+
+        if tracemalloc_every:
+            import tracemalloc
+            tracemalloc.start()
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> Optional['StageProfiler']:
+        """
+        Crear un perfilador a partir de PROFILE_STAGES, PROFILE_CPROFILE_EVERY,
+        PROFILE_TRACEMALLOC_EVERY y PROFILE_JSON (las variables vacías cuentan
+        como no definidas)
+
+        Args:
+            environ: Variables de entorno (default: os.environ)
+
+        Returns:
+            Perfilador, o None si PROFILE_STAGES no es 'true'
+        """
+        environ = os.environ if environ is None else environ
+        if (environ.get('PROFILE_STAGES') or 'false').lower() != 'true':
+            return None
+        return cls(
+            cprofile_every=int(environ.get('PROFILE_CPROFILE_EVERY') or 0),
+            tracemalloc_every=int(environ.get('PROFILE_TRACEMALLOC_EVERY') or 0),
+            json_path=environ.get('PROFILE_JSON') or None
+        )
+
+    # ------------------------------------------------------------------
+    # Camino crítico
+    # ------------------------------------------------------------------
+
+    def lap(self, stage: str, start: int) -> int:
+        """
+        Registrar la duración de una etapa
+
+        Args:
+            stage: Nombre de la etapa
+            start: Valor de clock() al inicio de la etapa
+
+        Returns:
+            clock() actual, para encadenar la siguiente etapa
+        """
+        now = time.perf_counter_ns()
+        if self._profiling:
+            # El mensaje muestreado por cProfile no es representativo
+            self._skipped += 1
+            return now
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = self._stages[stage] = _StageStats(self.window)
+        elapsed = now - start
+        stats.count += 1
+        stats.total += elapsed
+        stats.samples[stats.index] = elapsed
+        stats.index = (stats.index + 1) % self.window
+        return now
+
+    def message_start(self):
+        """Marcar el inicio de un mensaje (activa cProfile si toca muestrear)"""
+        self._messages += 1
+        if self.cprofile_every and self._messages % self.cprofile_every == 0:
+            if self._profile is None:
+                import cProfile
+                self._profile = cProfile.Profile()
+            self._profile.enable()
+            self._profiling = True
+
+    def message_end(self):
+        """Marcar el fin de un mensaje (detiene cProfile y toma snapshots)"""
+        if self._profiling:
+            self._profile.disable()
+            self._profiling = False
+        if self.tracemalloc_every and self._messages % self.tracemalloc_every == 0:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            if self._first_snapshot is None:
+                self._first_snapshot = snapshot
+            self._last_snapshot = snapshot
+
+    # ------------------------------------------------------------------
+    # Reportes
+    # ------------------------------------------------------------------
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Resumen por etapa
+
+        Returns:
+            {etapa: {'count', 'mean_us', 'p99_us', 'share'}} en orden de registro
+        """
+        grand_total = sum(stats.total for stats in self._stages.values()) or 1
+        result = {}
+        for stage, stats in self._stages.items():
+            samples = sorted(stats.samples[:min(stats.count, self.window)])
+            # p99 por rango más cercano
+            p99 = samples[math.ceil(len(samples) * 0.99) - 1] if samples else 0
+            result[stage] = {
+                'count': stats.count,
+                'mean_us': stats.total / stats.count / 1000 if stats.count else 0.0,
+                'p99_us': p99 / 1000,
+                'share': stats.total / grand_total,
+            }
+        return result
+
+    def format_table(self, headers: Sequence[str] = ('stage', 'n', 'mean µs', 'p99 µs', '% total'),
+                     tracemalloc_note: str = 'tracemalloc active: timings include allocation tracing',
+                     indent: str = '   ') -> List[str]:
+        """
+        Tabla de tiempos por etapa lista para imprimir
+
+        Args:
+            headers: Encabezados de las 5 columnas (permite localizar la tabla)
+            tracemalloc_note: Aviso agregado si tracemalloc estuvo activo
+            indent: Sangría de cada línea
+
+        Returns:
+            Líneas de la tabla
+        """
+        stage, count, mean, p99, share = headers
+        lines = [f"{indent}{stage:<10} {count:>7} {mean:>10} {p99:>10} {share:>8}"]
+        for name, row in self.summary().items():
+            lines.append(f"{indent}{name:<10} {row['count']:>7} {row['mean_us']:>10.1f} "
+                         f"{row['p99_us']:>10.1f} {row['share'] * 100:>7.1f}%")
+        if self.tracemalloc_active:
+            lines.append(f"{indent}⚠️  {tracemalloc_note}")
+        return lines
+
+    def top_functions(self, limit: int = 15) -> List[Dict[str, Any]]:
+        """Funciones con mayor tiempo acumulado en los mensajes muestreados por cProfile"""
+        if self._profile is None:
+            return []
+        import pstats
+        stats = pstats.Stats(self._profile)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [{
+            'function': f"{filename}:{line}({name})",
+            'calls': nc,
+            'tottime_ms': tt * 1000,
+            'cumtime_ms': ct * 1000,
+        } for (filename, line, name), (cc, nc, tt, ct, callers) in rows]
+
+    def memory_growth(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Líneas con mayor crecimiento de memoria entre el primer y el último snapshot"""
+        if self._first_snapshot is None or self._last_snapshot is self._first_snapshot:
+            return []
+        diff = self._last_snapshot.compare_to(self._first_snapshot, 'lineno')[:limit]
+        return [{
+            'location': str(stat.traceback),
+            'size_diff_kb': stat.size_diff / 1024,
+            'count_diff': stat.count_diff,
+        } for stat in diff]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Resumen completo serializable a JSON"""
+        return {
+            'messages': self._messages,
+            'tracemalloc_active': self.tracemalloc_active,
+            'laps_skipped_cprofile': self._skipped,
+            'stages': self.summary(),
+            'cprofile': self.top_functions(),
+            'tracemalloc': self.memory_growth(),
+        }
+
+    def dump_json(self, path: str):
+        """Guardar el resumen completo en un archivo JSON"""
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2))
+
+    def close(self):
+        """Guardar JSON (si se configuró) y detener tracemalloc"""
+        if self.json_path:
+            self.dump_json(self.json_path)
+        if self.tracemalloc_every:
+            import tracemalloc
+            tracemalloc.stop()
+            self.tracemalloc_every = 0